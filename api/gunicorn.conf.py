@@ -0,0 +1,45 @@
+import os
+
+# Lancement : gunicorn main:app (ce fichier est lu automatiquement depuis le dossier api/)
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+
+# Un worker uvicorn par cœur, chacun avec un seul thread d'inférence
+workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Pas de preload : chaque worker importe main.py après le fork, pour que le thread d'export
+# d'AzureLogHandler existe dans le worker. Téléchargements et conversions sont protégés
+# par un verrou de fichier dans main.py : un seul worker les fait, les autres réutilisent le résultat.
+preload_app = False
+
+raw_env = [
+    f"INFERENCE_THREADS={os.getenv('INFERENCE_THREADS', 1)}",
+    f"INFERENCE_WORKERS={os.getenv('INFERENCE_WORKERS', 1)}",
+    f"OMP_NUM_THREADS={os.getenv('OMP_NUM_THREADS', 1)}"
+]
+
+# Cœurs attribués aux workers vivants (worker.age -> CPU), tenu à jour par le master
+_assigned_cpus = {}
+
+def pre_fork(server, worker):
+    """Réserve, dans le master, un cœur libre pour le worker qui va être créé (Linux uniquement)."""
+    worker.cpu = None
+    if not hasattr(os, "sched_setaffinity"):
+        return
+
+    used = set(_assigned_cpus.values())
+    free = [cpu for cpu in sorted(os.sched_getaffinity(0)) if cpu not in used]
+    if free:
+        worker.cpu = free[0]
+        _assigned_cpus[worker.age] = worker.cpu
+
+def post_fork(server, worker):
+    """Épingle le worker sur le cœur réservé ; sans cœur libre, il n'est pas épinglé."""
+    if worker.cpu is None:
+        return
+
+    os.sched_setaffinity(0, {worker.cpu})
+    server.log.info(f"Worker {worker.pid} épinglé sur le CPU {worker.cpu}")
+
+def child_exit(server, worker):
+    """Libère le cœur d'un worker terminé pour son remplaçant."""
+    _assigned_cpus.pop(worker.age, None)
@@ -1,112 +1,783 @@
 import os
-import json
+import re
+import pickle
+import hashlib
+import random
+import orjson
+import asyncio
+import threading
 import requests
+import numpy as np
 import tensorflow as tf
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from azure.core import MatchConditions
+from azure.identity import DefaultAzureCredential
 from azure.storage.blob import BlobServiceClient
-from tensorflow.keras.preprocessing.text import tokenizer_from_json
-from tensorflow.keras.preprocessing.sequence import pad_sequences
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse, RedirectResponse
+from fastapi.routing import APIRoute
 from pydantic import BaseModel
+from cachetools import LRUCache, TTLCache
 from opencensus.ext.azure.log_exporter import AzureLogHandler
 import logging
 import uvicorn
 
+try:
+    import fcntl
+except ImportError:
+    # Windows : pas de verrou inter-processus (un seul worker en local)
+    fcntl = None
+
 # === Configuration Azure Blob Storage ===
-AZURE_STORAGE_ACCOUNT_NAME = "stockagebadbuzzapi"
-AZURE_STORAGE_ACCOUNT_KEY = "cefTtXePUQr655aYq8/Quz6iYeR/U20y0ehaOQoXmIxc6It80fGCFtgT0/xDPO01M09+3/IJsVvV+AStVohYzA=="
+AZURE_STORAGE_ACCOUNT_NAME = os.getenv("AZURE_STORAGE_ACCOUNT_NAME", "stockagebadbuzzapi")
+# Clé fournie par l'environnement ; à défaut, identité managée (ou Azure CLI en local)
+AZURE_STORAGE_ACCOUNT_KEY = os.getenv("AZURE_STORAGE_ACCOUNT_KEY")
 CONTAINER_NAME = "models"
 
+# Client unique : son pool de connexions est réutilisé par tous les téléchargements
+blob_service_client = BlobServiceClient(
+    account_url=f"https://{AZURE_STORAGE_ACCOUNT_NAME}.blob.core.windows.net",
+    credential=AZURE_STORAGE_ACCOUNT_KEY or DefaultAzureCredential(),
+    max_single_get_size=64 * 1024 * 1024,
+    max_chunk_get_size=16 * 1024 * 1024
+)
+
+# Vérification de fraîcheur au démarrage : courte et sans nouvelle tentative, pour qu'un
+# Azure injoignable ne bloque pas chaque worker pendant le backoff de la politique par défaut
+BLOB_PROBE_TIMEOUT = float(os.getenv("BLOB_PROBE_TIMEOUT", 5))
+
 # Dossier local des modèles
 MODEL_DIR = "models"
 os.makedirs(MODEL_DIR, exist_ok=True)
 
+def _is_stale(derived_path, source_path):
+    """Indique si un artefact dérivé est absent ou plus ancien que le modèle source."""
+    return not os.path.exists(derived_path) or os.path.getmtime(derived_path) < os.path.getmtime(source_path)
+
+def _temporary_path(path):
+    """Chemin temporaire propre au processus, renommé atomiquement une fois l'écriture terminée."""
+    return f"{path}.{os.getpid()}.tmp"
+
+def _atomic_write_bytes(path, data):
+    """Écrit un fichier en entier ou pas du tout, même si plusieurs workers démarrent ensemble."""
+    tmp_path = _temporary_path(path)
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def _file_lock(path):
+    """Verrou inter-processus : un seul worker télécharge ou convertit un fichier donné."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _is_up_to_date(local_file_path, etag_path, properties):
+    """Compare la taille et l'etag du blob à ceux de la copie locale."""
+    if not os.path.exists(local_file_path) or os.path.getsize(local_file_path) != properties.size:
+        return False
+    if not os.path.exists(etag_path):
+        return False
+    with open(etag_path, "r", encoding="utf-8") as f:
+        return f.read() == properties.etag
+
 # Fonction pour télécharger un fichier depuis Azure Blob Storage
 def download_model_from_azure(blob_name):
-    """Télécharge un modèle depuis Azure Blob Storage si non présent en local."""
+    """Télécharge un modèle depuis Azure Blob Storage si la copie locale est absente ou périmée."""
     local_file_path = os.path.join(MODEL_DIR, blob_name)
+    etag_path = local_file_path + ".etag"
 
-    if not os.path.exists(local_file_path):
-        print(f"Téléchargement de {blob_name} depuis Azure...")
-        try:
-            blob_service_client = BlobServiceClient(
-                account_url=f"https://{AZURE_STORAGE_ACCOUNT_NAME}.blob.core.windows.net",
-                credential=AZURE_STORAGE_ACCOUNT_KEY
-            )
-            blob_client = blob_service_client.get_blob_client(CONTAINER_NAME, blob_name)
+    try:
+        blob_client = blob_service_client.get_blob_client(CONTAINER_NAME, blob_name)
+        properties = blob_client.get_blob_properties(
+            retry_total=0,
+            connection_timeout=BLOB_PROBE_TIMEOUT,
+            read_timeout=BLOB_PROBE_TIMEOUT
+        )
+    except Exception as e:
+        # Azure injoignable ou blob absent : la copie locale, si elle existe, fait foi
+        if os.path.exists(local_file_path):
+            return local_file_path
+        print(f" Erreur lors du téléchargement de {blob_name} : {e}")
+        return None
 
-            with open(local_file_path, "wb") as f:
-                f.write(blob_client.download_blob().readall())
+    if _is_up_to_date(local_file_path, etag_path, properties):
+        return local_file_path
 
-            print(f"{blob_name} téléchargé avec succès !")
-        except Exception as e:
-            print(f" Erreur lors du téléchargement de {blob_name} : {e}")
-            return None
+    print(f"Téléchargement de {blob_name} depuis Azure...")
+    tmp_path = _temporary_path(local_file_path)
+    try:
+        # Certains blobs sont rangés dans un sous-dossier (ex : distilbert_model/)
+        os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+
+        # Téléchargement par blocs en parallèle, écrits au fil de l'eau dans un fichier temporaire :
+        # la mémoire reste constante et un fichier partiel n'est jamais pris pour un modèle valide
+        with open(tmp_path, "wb") as f:
+            blob_client.download_blob(
+                max_concurrency=8,
+                etag=properties.etag,
+                match_condition=MatchConditions.IfNotModified
+            ).readinto(f)
+
+        os.replace(tmp_path, local_file_path)
+        _atomic_write_bytes(etag_path, properties.etag.encode("utf-8"))
+        print(f"{blob_name} téléchargé avec succès !")
+    except Exception as e:
+        print(f" Erreur lors du téléchargement de {blob_name} : {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
 
     return local_file_path
 
-#  Liste des modèles à récupérer
-model_files = [
-    "best_model_fasttext.keras",
-    "best_model_glove.keras",
-    "best_model_w2v.keras",
-    "best_model_bert.keras",
-    "distilbert_model/tf_model.h5",
-    "tokenizer_fasttext.json",
-    "tokenizer_glove.json",
-    "tokenizer_w2v.json"
-]
-
-#  Téléchargement des modèles au démarrage
-for model in model_files:
-    download_model_from_azure(model)
-
-print("Tous les modèles sont prêts à être utilisés !")
+#  Registre des modèles disponibles sur Azure (téléchargés à la demande)
+MODEL_BLOBS = {
+    "fasttext": "best_model_fasttext.keras",
+    "glove": "best_model_glove.keras",
+    "w2v": "best_model_w2v.keras",
+    "bert": "best_model_bert.keras",
+    "distilbert": "distilbert_model/tf_model.h5",
+    "tokenizer_fasttext": "tokenizer_fasttext.json",
+    "tokenizer_glove": "tokenizer_glove.json",
+    "tokenizer_w2v": "tokenizer_w2v.json"
+}
+
+_model_paths = {}
+_download_locks = {name: threading.Lock() for name in MODEL_BLOBS}
+
+def get_model_file(name):
+    """Renvoie le chemin local d'un modèle du registre, téléchargé à la première demande."""
+    path = _model_paths.get(name)
+    if path is None:
+        # Double vérification : un seul téléchargement même si plusieurs threads demandent le fichier,
+        # et le verrou de fichier fait attendre les autres workers, qui trouvent ensuite la copie à jour
+        with _download_locks[name], _file_lock(os.path.join(MODEL_DIR, MODEL_BLOBS[name])):
+            path = _model_paths.get(name)
+            if path is None:
+                path = download_model_from_azure(MODEL_BLOBS[name])
+                if path is not None:
+                    _model_paths[name] = path
+    return path
 
 # === Configuration des logs et Azure Application Insights ===
 instrumentation_key = os.getenv("APPINSIGHTS_INSTRUMENTATIONKEY", "ad29b7fd-4184-4a49-a1f4-97371d2cb7ae")
 
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLING_RATE = float(os.getenv("LOG_SAMPLING_RATE", 0.1))
+
+class SamplingFilter(logging.Filter):
+    """Ne conserve qu'une fraction des logs INFO ; les avertissements et erreurs passent tous."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
 # Configuration du logger
 logger = logging.getLogger("api_logger")
-logger.setLevel(logging.INFO)
+logger.setLevel(LOG_LEVEL)
 azure_handler = AzureLogHandler(connection_string=f'InstrumentationKey={instrumentation_key}')
 logger.addHandler(azure_handler)
 
+# Logs émis à chaque requête : échantillonnés (le filtre d'un logger ne s'applique qu'à ses propres logs)
+request_logger = logging.getLogger("api_logger.requests")
+request_logger.addFilter(SamplingFilter(LOG_SAMPLING_RATE))
+
 if logger.hasHandlers():
     logger.info("Logger Azure Insights actif")
 else:
     logger.warning("Attention : Azure Insights ne reçoit pas les logs")
 
 # === Chargement du modèle ===
-model_path = os.path.join(MODEL_DIR, "best_model_fasttext.keras")
+def load_model():
+    """Télécharge si besoin puis charge le modèle fasttext."""
+    model_path = get_model_file("fasttext") or os.path.join(MODEL_DIR, MODEL_BLOBS["fasttext"])
 
-if not os.path.exists(model_path):
-    raise FileNotFoundError(f"Modèle non trouvé : {model_path}")
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Modèle non trouvé : {model_path}")
 
-try:
-    model = tf.keras.models.load_model(model_path)
-    logger.info("Modèle chargé avec succès !")
-except Exception as e:
-    logger.error(f"Erreur de chargement du modèle : {e}")
-    raise ValueError(f"Erreur de chargement du modèle : {e}")
+    try:
+        model = tf.keras.models.load_model(model_path)
+        logger.info("Modèle chargé avec succès !")
+    except Exception as e:
+        logger.error(f"Erreur de chargement du modèle : {e}")
+        raise ValueError(f"Erreur de chargement du modèle : {e}")
+
+    return model
 
 # === Chargement du tokenizer JSON ===
-tokenizer_path = os.path.join(MODEL_DIR, "tokenizer_fasttext.json")  
+class TokenizerVocab:
+    """Sous-ensemble du Tokenizer Keras utilisé par l'API : vocabulaire et règles de découpage."""
+
+    def __init__(self, word_index, num_words=None, oov_token=None,
+                 filters='!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n', lower=True, split=" "):
+        self.word_index = word_index
+        self.num_words = num_words
+        self.oov_token = oov_token
+        self.filters = filters
+        self.lower = lower
+        self.split = split
+
+def _parse_tokenizer_json(tokenizer_path):
+    """Extrait du JSON Keras les seuls champs utiles, sans reconstruire le Tokenizer complet."""
+    with open(tokenizer_path, "rb") as f:
+        tokenizer_data = orjson.loads(f.read())
+
+    # Le fichier contient la chaîne produite par tokenizer.to_json()
+    if isinstance(tokenizer_data, str):
+        tokenizer_data = orjson.loads(tokenizer_data)
+
+    config = tokenizer_data["config"]
+    word_index = config["word_index"]
+    if isinstance(word_index, str):
+        word_index = orjson.loads(word_index)
+
+    fields = {key: config[key] for key in ("num_words", "oov_token", "filters", "lower", "split") if key in config}
+    fields["word_index"] = word_index
+    return fields
+
+def load_tokenizer():
+    """Télécharge si besoin puis charge le tokenizer fasttext (via un cache pickle du vocabulaire)."""
+    tokenizer_path = get_model_file("tokenizer_fasttext") or os.path.join(MODEL_DIR, MODEL_BLOBS["tokenizer_fasttext"])
+    cache_path = os.path.splitext(tokenizer_path)[0] + ".pkl"
+
+    if not os.path.exists(tokenizer_path):
+        raise FileNotFoundError(f"Tokenizer non trouvé : {tokenizer_path}")
 
-if not os.path.exists(tokenizer_path):
-    raise FileNotFoundError(f"Tokenizer non trouvé : {tokenizer_path}")
+    try:
+        with _file_lock(cache_path):
+            if _is_stale(cache_path, tokenizer_path):
+                fields = _parse_tokenizer_json(tokenizer_path)
+                _atomic_write_bytes(cache_path, pickle.dumps(fields, protocol=pickle.HIGHEST_PROTOCOL))
+            else:
+                with open(cache_path, "rb") as f:
+                    fields = pickle.load(f)
+
+        tokenizer = TokenizerVocab(**fields)
+        logger.info("Tokenizer chargé avec succès !")
+    except Exception as e:
+        logger.error(f"Erreur de chargement du tokenizer : {e}")
+        raise ValueError(f"Erreur de chargement du tokenizer : {e}")
+
+    return tokenizer
+
+# === Tokenisation rapide ===
+def build_encoder(tokenizer):
+    """Construit un encodeur équivalent à tokenizer.texts_to_sequences pour un texte seul."""
+    num_words = tokenizer.num_words
+    oov_index = tokenizer.word_index.get(tokenizer.oov_token) if tokenizer.oov_token else None
+    lower = tokenizer.lower
+    filters = tokenizer.filters
+    split = tokenizer.split
+
+    # Les indices au-delà de num_words sont hors vocabulaire, comme dans Keras
+    word_index = {w: i for w, i in tokenizer.word_index.items() if not num_words or i < num_words}
+
+    if (filters + split).isascii() and len(split) == 1:
+        # Comme Keras, chaque caractère filtré devient le séparateur, mais via bytes.translate
+        # sur l'UTF-8 (en C) ; les octets ASCII n'apparaissent jamais dans un caractère multi-octets
+        table = bytes.maketrans(filters.encode(), split.encode() * len(filters))
+        separator = split.encode()
+        byte_index = {w.encode("utf-8", "surrogatepass"): i for w, i in word_index.items()}
+
+        def encode(text: str) -> list:
+            if lower:
+                text = text.lower()
+            words = text.encode("utf-8", "surrogatepass").translate(table).split(separator)
+            ids = (byte_index.get(w, oov_index) for w in words if w)
+            return [i for i in ids if i is not None][:50]
+
+        return encode
+
+    # Filtres non ASCII : découpage sur les suites de caractères filtrés (équivalent au remplacement)
+    split_re = re.compile("[" + re.escape(filters + split) + "]+")
+
+    def encode(text: str) -> list:
+        if lower:
+            text = text.lower()
+        ids = (word_index.get(w, oov_index) for w in split_re.split(text) if w)
+        return [i for i in ids if i is not None][:50]
+
+    return encode
+
+# === Moteur d'inférence ===
+# "tflite" : modèle quantifié int8 (par défaut), "tf" : graphe TensorFlow compilé,
+# "onnx" : ONNX Runtime (optionnel, nécessite onnxruntime et tf2onnx, non installés par défaut)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "tflite")
+# Un seul thread par inférence : le parallélisme vient du pool de threads et des workers gunicorn
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", 1))
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", os.cpu_count()))
+XLA_JIT_COMPILE = os.getenv("XLA_JIT_COMPILE", "1") == "1"
+TFLITE_MODEL_PATH = os.path.join(MODEL_DIR, "best_model_fasttext_int8.tflite")
+# Tailles de batch fixes (interpréteurs TFLite, graphes XLA), en plus de MAX_BATCH
+TFLITE_BATCH_SIZES = [int(size) for size in os.getenv("TFLITE_BATCH_SIZES", "1,8").split(",")]
+# Export local dérivé du .keras, distinct de tout blob Azure (comme le modèle TFLite)
+ONNX_MODEL_PATH = os.path.join(MODEL_DIR, "best_model_fasttext_export.onnx")
+
+# À configurer avant la première opération TensorFlow
+tf.config.threading.set_intra_op_parallelism_threads(INFERENCE_THREADS)
+tf.config.threading.set_inter_op_parallelism_threads(1)
+
+# Types ONNX des entrées possibles du modèle exporté
+ONNX_INPUT_DTYPES = {"tensor(int32)": np.int32, "tensor(int64)": np.int64, "tensor(float)": np.float32}
+
+def _build_tf_infer(model, batch_sizes):
+    """Compile model(x, training=False) en graphe, sans la boucle Keras de model.predict."""
+    graph = tf.function(
+        lambda x: model(x, training=False),
+        input_signature=[tf.TensorSpec([None, 50], tf.int32)],
+        jit_compile=XLA_JIT_COMPILE
+    )
+    # XLA compile une fois par taille de batch : les batches sont paddés à quelques tailles fixes,
+    # toutes compilées au démarrage plutôt que pendant les requêtes
+    sizes = sorted(set(batch_sizes))
+    for size in sizes:
+        graph(tf.zeros((size, 50), dtype=tf.int32))
+
+    def run(batch):
+        count = len(batch)
+        padded = np.zeros((next(size for size in sizes if size >= count), 50), dtype=np.int32)
+        padded[:count] = batch
+        return graph(tf.constant(padded)).numpy()[:count]
+
+    def infer(batch):
+        # Les batches plus grands que la plus grande taille sont découpés
+        largest = sizes[-1]
+        return np.concatenate([run(batch[start:start + largest]) for start in range(0, len(batch), largest)])
+
+    return infer
+
+def _representative_dataset(model, vocab_size, samples=200):
+    """Séquences paddées aléatoires servant à calibrer la quantification int8."""
+    rng = np.random.default_rng(0)
+    input_dtype = model.inputs[0].dtype.as_numpy_dtype
+
+    for _ in range(samples):
+        length = rng.integers(1, 51)
+        sequence = np.zeros((1, 50), dtype=input_dtype)
+        sequence[0, :length] = rng.integers(1, vocab_size, size=length)
+        yield [sequence]
+
+def convert_to_tflite(model, output_path, vocab_size):
+    """Convertit une fois le modèle Keras en TFLite quantifié int8."""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = lambda: _representative_dataset(model, vocab_size)
+    # Les opérations LSTM non supportées en natif passent par les ops TensorFlow
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+
+    _atomic_write_bytes(output_path, converter.convert())
+
+class _TFLiteBucket:
+    """Interpréteur alloué une fois pour une taille de batch fixe ; les entrées plus courtes sont paddées."""
+
+    def __init__(self, model_path, num_threads, batch_size):
+        self.batch_size = batch_size
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+
+        input_details = self.interpreter.get_input_details()[0]
+        self.input_index = input_details["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.interpreter.resize_tensor_input(self.input_index, [batch_size, 50])
+        self.interpreter.allocate_tensors()
+
+        self.input = np.zeros((batch_size, 50), dtype=input_details["dtype"])
+        # L'interpréteur n'est pas thread-safe : un verrou par taille de batch
+        self.lock = threading.Lock()
+
+    def run(self, batch):
+        count = len(batch)
+        with self.lock:
+            self.input[:count] = batch
+            self.input[count:] = 0
+            self.interpreter.set_tensor(self.input_index, self.input)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_index)[:count]
+
+class TFLiteRunner:
+    """Exécute le modèle TFLite sur quelques tailles de batch fixes, sans réallocation par appel."""
+
+    def __init__(self, model_path, num_threads, batch_sizes):
+        self.buckets = [_TFLiteBucket(model_path, num_threads, size) for size in sorted(set(batch_sizes))]
+
+    def _bucket_for(self, count):
+        for bucket in self.buckets:
+            if bucket.batch_size >= count:
+                return bucket
+        return self.buckets[-1]
+
+    def __call__(self, batch):
+        # Les batches plus grands que le plus grand bucket sont découpés
+        largest = self.buckets[-1].batch_size
+        outputs = [
+            self._bucket_for(len(batch[start:start + largest])).run(batch[start:start + largest])
+            for start in range(0, len(batch), largest)
+        ]
+        return np.concatenate(outputs)
+
+def convert_to_onnx(model, output_path):
+    """Exporte le modèle Keras en ONNX (équivalent de `python -m tf2onnx.convert --keras`)."""
+    # tf2onnx n'est nécessaire que pour le moteur "onnx", optionnel
+    import tf2onnx
+
+    input_signature = [tf.TensorSpec([None, 50], model.inputs[0].dtype, name="input")]
+    tmp_path = _temporary_path(output_path)
+    tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=17, output_path=tmp_path)
+    os.replace(tmp_path, output_path)
+
+class ONNXRunner:
+    """Exécute le modèle avec ONNX Runtime, optimisations de graphe activées."""
+
+    def __init__(self, model_path, num_threads):
+        # onnxruntime n'est nécessaire que pour le moteur "onnx", optionnel
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = ONNX_INPUT_DTYPES[model_input.type]
+
+    def __call__(self, batch):
+        # InferenceSession.run est thread-safe : pas de verrou nécessaire
+        return self.session.run(None, {self.input_name: batch.astype(self.input_dtype, copy=False)})[0]
+
+def _build_onnx_infer(model):
+    """Exporte le modèle ONNX s'il est absent ou plus ancien que le .keras, puis ouvre la session."""
+    model_path = os.path.join(MODEL_DIR, MODEL_BLOBS["fasttext"])
+
+    with _file_lock(ONNX_MODEL_PATH):
+        if _is_stale(ONNX_MODEL_PATH, model_path):
+            logger.info("Export du modèle en ONNX...")
+            convert_to_onnx(model, ONNX_MODEL_PATH)
+
+    return ONNXRunner(ONNX_MODEL_PATH, INFERENCE_THREADS)
+
+def build_inference(model, tokenizer):
+    """Initialise le moteur d'inférence choisi et le préchauffe."""
+    backend = INFERENCE_BACKEND
 
-try:
-    with open(tokenizer_path, "r", encoding="utf-8") as f:
-        tokenizer_data = json.load(f)
-        tokenizer = tokenizer_from_json(tokenizer_data)
-    logger.info("Tokenizer chargé avec succès !")
-except Exception as e:
-    logger.error(f"Erreur de chargement du tokenizer : {e}")
-    raise ValueError(f"Erreur de chargement du tokenizer : {e}")
+    try:
+        if backend == "onnx":
+            try:
+                infer = _build_onnx_infer(model)
+            except Exception as e:
+                logger.warning(f"ONNX indisponible, repli sur TFLite : {e}")
+                backend = "tflite"
+
+        if backend == "tflite":
+            model_path = os.path.join(MODEL_DIR, MODEL_BLOBS["fasttext"])
+            with _file_lock(TFLITE_MODEL_PATH):
+                if _is_stale(TFLITE_MODEL_PATH, model_path):
+                    logger.info("Conversion du modèle en TFLite int8...")
+                    convert_to_tflite(model, TFLITE_MODEL_PATH, tokenizer.num_words or len(tokenizer.word_index) + 1)
+            infer = TFLiteRunner(TFLITE_MODEL_PATH, INFERENCE_THREADS, TFLITE_BATCH_SIZES + [MAX_BATCH])
+        elif backend == "tf":
+            infer = _build_tf_infer(model, TFLITE_BATCH_SIZES + [MAX_BATCH])
+        elif backend != "onnx":
+            raise ValueError(f"Moteur d'inférence inconnu : {backend}")
+
+        # Préchauffage : trace/alloue le moteur avant la première requête
+        infer(np.zeros((1, 50), dtype=np.int32))
+        logger.info(f"Moteur d'inférence prêt : {backend}")
+    except Exception as e:
+        logger.error(f"Erreur d'initialisation du moteur d'inférence : {e}")
+        raise ValueError(f"Erreur d'initialisation du moteur d'inférence : {e}")
+
+    return infer
+
+# === Raccourci lexical ===
+# Désactivé par défaut : les textes courts composés uniquement de tokens à forte polarité
+# sont classés sans passer par le modèle, si l'accord avec le modèle dépasse 99 %
+LEXICON_FAST_PATH = os.getenv("LEXICON_FAST_PATH", "0") == "1"
+LEXICON_VOCAB_SIZE = int(os.getenv("LEXICON_VOCAB_SIZE", 20000))
+LEXICON_THRESHOLD = float(os.getenv("LEXICON_THRESHOLD", 0.99))
+LEXICON_MAX_TOKENS = int(os.getenv("LEXICON_MAX_TOKENS", 3))
+LEXICON_MIN_AGREEMENT = 0.99
+
+class Lexicon:
+    """Ensembles de tokens à polarité forte, consultés avant le modèle."""
+
+    def __init__(self, strong_pos, strong_neg, max_tokens=LEXICON_MAX_TOKENS):
+        self.strong_pos = strong_pos
+        self.strong_neg = strong_neg
+        self.max_tokens = max_tokens
+
+    def lookup(self, ids):
+        """Renvoie le sentiment si tous les tokens ont la même polarité forte, sinon None."""
+        if not ids or len(ids) > self.max_tokens:
+            return None
+        if self.strong_pos.issuperset(ids):
+            return "positive"
+        if self.strong_neg.issuperset(ids):
+            return "negative"
+        return None
+
+def _score_single_tokens(infer, ids, chunk_size=1024):
+    """Score du modèle pour chaque token pris seul (séquence paddée d'un unique token)."""
+    scores = []
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        batch = np.zeros((len(chunk), 50), dtype=np.int32)
+        batch[:, 0] = chunk
+        scores.append(infer(batch)[:, 0])
+    return np.concatenate(scores)
+
+def _lexicon_agreement(infer, lexicon, samples=2000):
+    """Taux d'accord entre le lexique et le modèle sur des combinaisons aléatoires de tokens."""
+    rng = np.random.default_rng(0)
+    agree = total = 0
+
+    for tokens, sentiment in ((lexicon.strong_pos, "positive"), (lexicon.strong_neg, "negative")):
+        if not tokens:
+            continue
+        pool = np.array(sorted(tokens), dtype=np.int32)
+        batch = np.zeros((samples, 50), dtype=np.int32)
+        for row in batch:
+            length = rng.integers(1, lexicon.max_tokens + 1)
+            row[:length] = rng.choice(pool, size=length)
+
+        predicted_positive = infer(batch)[:, 0] > 0.5
+        agree += int((predicted_positive == (sentiment == "positive")).sum())
+        total += samples
+
+    return agree / total if total else 0.0
+
+def build_lexicon(infer, tokenizer):
+    """Construit le lexique à partir des tokens les plus fréquents ; None si l'accord est insuffisant."""
+    vocab_size = min(LEXICON_VOCAB_SIZE, tokenizer.num_words or len(tokenizer.word_index) + 1)
+    oov_index = tokenizer.word_index.get(tokenizer.oov_token) if tokenizer.oov_token else None
+
+    ids = np.array([i for i in range(1, vocab_size) if i != oov_index], dtype=np.int32)
+    scores = _score_single_tokens(infer, ids)
+    lexicon = Lexicon(
+        frozenset(ids[scores >= LEXICON_THRESHOLD].tolist()),
+        frozenset(ids[scores <= 1 - LEXICON_THRESHOLD].tolist())
+    )
+
+    agreement = _lexicon_agreement(infer, lexicon)
+    if agreement < LEXICON_MIN_AGREEMENT:
+        logger.warning(f"Raccourci lexical désactivé : accord avec le modèle de {agreement:.2%}")
+        return None
+
+    logger.info(
+        f"Raccourci lexical actif : {len(lexicon.strong_pos)} tokens positifs, "
+        f"{len(lexicon.strong_neg)} négatifs, accord de {agreement:.2%}"
+    )
+    return lexicon
+
+# === Cache des prédictions ===
+# Les tweets identiques (viraux, re-soumis) sont servis sans repasser par le modèle
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", 10000))
+CACHE_TTL = int(os.getenv("CACHE_TTL", 3600))
+
+prediction_cache = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+cache_stats = {"hits": 0, "misses": 0}
+
+def build_cache_key(tokenizer):
+    """Normalise le texte pour le cache sans confondre deux textes que le tokenizer distingue."""
+    # Seuls les caractères supprimés par le tokenizer sont retirés aux extrémités :
+    # str.strip() seul enlèverait aussi "\r" ou "\u00a0", que Keras garde dans les tokens
+    strip_chars = tokenizer.filters + (tokenizer.split if len(tokenizer.split) == 1 else "")
+    lower = tokenizer.lower
+
+    def cache_key(text: str) -> str:
+        if lower:
+            text = text.lower()
+        return text.strip(strip_chars)
+
+    return cache_key
+
+# === Micro-batching des prédictions ===
+# Les requêtes concurrentes sont regroupées pendant quelques ms en un seul appel au modèle
+MAX_BATCH = int(os.getenv("MAX_BATCH", 64))
+BATCH_TIMEOUT = float(os.getenv("BATCH_TIMEOUT_MS", 5)) / 1000
+
+# L'inférence, bloquante, s'exécute hors de la boucle d'événements
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS)
+
+class PredictionBatcher:
+    """Collecte les séquences en attente et les prédit en un seul batch.
+
+    Le padding est écrit directement dans des buffers (MAX_BATCH, 50) préalloués,
+    réutilisés d'un batch à l'autre. Au plus `concurrency` batches sont en cours :
+    tant que les threads d'inférence sont occupés, les requêtes s'accumulent dans la file
+    et le batch suivant grossit jusqu'à MAX_BATCH.
+    """
+
+    def __init__(self, infer, max_batch: int = MAX_BATCH, timeout: float = BATCH_TIMEOUT,
+                 concurrency: int = INFERENCE_WORKERS):
+        self.infer = infer
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.queue = None
+        self.slots = None
+        self.task = None
+        self.inflight = set()
+        self.collecting = []
+        self.buffers = []
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+        # Requêtes retirées de la file mais pas encore envoyées, puis celles encore en file
+        pending = [future for _, future in self.collecting]
+        while not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            pending.append(future)
+
+        for future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Arrêt du service en cours"))
+
+        # Les batches déjà partis vont jusqu'au bout : leurs requêtes reçoivent leur résultat
+        await asyncio.gather(*self.inflight, return_exceptions=True)
+
+    async def predict(self, ids: list) -> float:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((ids, future))
+        return await future
+
+    async def _collect(self) -> list:
+        """Attend une première séquence puis regroupe les suivantes jusqu'au timeout."""
+        loop = asyncio.get_running_loop()
+        # Gardées sur l'instance pour que stop() puisse les libérer si la collecte est interrompue
+        items = self.collecting = []
+        items.append(await self.queue.get())
+        deadline = loop.time() + self.timeout
+
+        while len(items) < self.max_batch:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        self.collecting = []
+        return items
+
+    async def _run(self):
+        while True:
+            # Contre-pression : on ne collecte que si un thread d'inférence est libre
+            await self.slots.acquire()
+            items = await self._collect()
+            # Le batch part dans le pool de threads : la collecte du suivant continue en parallèle
+            task = asyncio.create_task(self._predict_batch(items))
+            self.inflight.add(task)
+            task.add_done_callback(self.inflight.discard)
+
+    def _fill(self, buffer: np.ndarray, items: list) -> np.ndarray:
+        """Écrit les séquences du batch dans le buffer avec un padding "post"."""
+        batch = buffer[:len(items)]
+        batch.fill(0)
+        for row, (ids, _) in zip(batch, items):
+            row[:len(ids)] = ids
+        return batch
+
+    async def _predict_batch(self, items: list):
+        # Plusieurs batches peuvent être en cours : chacun emprunte son propre buffer
+        buffer = self.buffers.pop() if self.buffers else np.zeros((self.max_batch, 50), dtype=np.int32)
+
+        try:
+            loop = asyncio.get_running_loop()
+            batch = self._fill(buffer, items)
+            predictions = await loop.run_in_executor(inference_executor, self.infer, batch)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            # Les moteurs copient l'entrée : le buffer est réutilisable dès le retour de infer
+            self.buffers.append(buffer)
+            self.slots.release()
+
+        for (_, future), prediction in zip(items, predictions):
+            # La requête a pu être annulée entre temps (client déconnecté)
+            if not future.done():
+                future.set_result(float(prediction[0]))
+
+# === Cycle de vie de l'application ===
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Téléchargement et chargement du modèle et du tokenizer en parallèle, hors de la boucle
+    model, tokenizer = await asyncio.gather(
+        asyncio.to_thread(load_model),
+        asyncio.to_thread(load_tokenizer)
+    )
+    app.state.model = model
+    app.state.tokenizer = tokenizer
+    app.state.encode = build_encoder(tokenizer)
+    app.state.cache_key = build_cache_key(tokenizer)
+    app.state.infer = await asyncio.to_thread(build_inference, model, tokenizer)
+    app.state.lexicon = await asyncio.to_thread(build_lexicon, app.state.infer, tokenizer) if LEXICON_FAST_PATH else None
+
+    app.state.batcher = PredictionBatcher(app.state.infer)
+    await app.state.batcher.start()
+    yield
+    await app.state.batcher.stop()
+
+# === Prédiction ===
+async def _predict_sentiment(state, text: str) -> str:
+    """Renvoie le sentiment prédit, via le lexique si possible, sinon par micro-batching."""
+    ids = state.encode(text)
+
+    if state.lexicon is not None:
+        sentiment = state.lexicon.lookup(ids)
+        if sentiment is not None:
+            return sentiment
+
+    score = await state.batcher.predict(ids)
+    return "positive" if score > 0.5 else "negative"
+
+# === Sérialisation JSON avec orjson ===
+class ORJSONRequest(Request):
+    """Requête dont le corps JSON est décodé avec orjson."""
+
+    async def json(self):
+        if not hasattr(self, "_json"):
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+class ORJSONRoute(APIRoute):
+    """Route FastAPI qui reçoit des ORJSONRequest."""
+
+    def get_route_handler(self):
+        route_handler = super().get_route_handler()
+
+        async def orjson_route_handler(request: Request):
+            return await route_handler(ORJSONRequest(request.scope, request.receive))
+
+        return orjson_route_handler
 
 # === Initialisation de FastAPI ===
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+app.router.route_class = ORJSONRoute
 
 # Redirection vers la documentation automatique
 @app.get("/", include_in_schema=False)
@@ -124,22 +795,30 @@ class FeedbackInput(BaseModel):
 
 # === Endpoint de prédiction ===
 @app.post("/predict")
-async def predict(input: TextInput):
+async def predict(input: TextInput, request: Request):
     try:
         if not input.text.strip():
             raise HTTPException(status_code=400, detail="Le texte d'entrée est vide")
 
-        # Transformer le texte en séquence avec le tokenizer
-        sequence = tokenizer.texts_to_sequences([input.text])
-
-        # Appliquer le padding pour correspondre à la taille attendue par le modèle (max_length=50)
-        sequence_padded = pad_sequences(sequence, maxlen=50, padding="post", truncating="post")
-
-        # Faire la prédiction avec le modèle
-        prediction = model.predict(sequence_padded)
-        sentiment = "positive" if prediction[0][0] > 0.5 else "negative"
-
-        logger.info(f"Prédiction : {sentiment} | Texte : {input.text}")
+        # Clé normalisée, utilisée uniquement pour le cache : le modèle reçoit le texte d'origine
+        cache_key = request.app.state.cache_key(input.text)
+        sentiment = prediction_cache.get(cache_key)
+
+        if sentiment is None:
+            cache_stats["misses"] += 1
+            sentiment = await _predict_sentiment(request.app.state, input.text)
+            prediction_cache[cache_key] = sentiment
+            cache_status = "miss"
+        else:
+            cache_stats["hits"] += 1
+            cache_status = "hit"
+
+        # Arguments différés : 90 % des logs sont écartés par SamplingFilter avant tout formatage,
+        # et les compteurs du cache ne sont lus qu'à l'export des logs conservés
+        request_logger.info(
+            "Prédiction : %s | Cache : %s | Texte : %s", sentiment, cache_status, input.text,
+            extra={"custom_dimensions": cache_stats}
+        )
         return {"prediction": sentiment}
 
     except HTTPException as he:
@@ -151,7 +830,12 @@ async def predict(input: TextInput):
         raise HTTPException(status_code=500, detail="Erreur serveur lors de la prédiction")
 
 # === Gestion du feedback utilisateur ===
-error_feedback_counter = {}
+# Compteur borné, indexé par un condensé du texte pour limiter la taille des clés
+FEEDBACK_COUNTER_SIZE = int(os.getenv("FEEDBACK_COUNTER_SIZE", 100_000))
+error_feedback_counter = LRUCache(maxsize=FEEDBACK_COUNTER_SIZE)
+
+def _feedback_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
 
 @app.post("/feedback")
 async def feedback(input: FeedbackInput):
@@ -164,9 +848,10 @@ async def feedback(input: FeedbackInput):
         if not input.validation:
             logger.warning(f"Tweet mal prédit : {input.text} | Prédiction : {input.prediction}")
 
-            error_feedback_counter[input.text] = error_feedback_counter.get(input.text, 0) + 1
+            key = _feedback_key(input.text)
+            error_feedback_counter[key] = error_feedback_counter.get(key, 0) + 1
 
-            if error_feedback_counter[input.text] >= 3:
+            if error_feedback_counter[key] >= 3:
                 logger.error("ALERTE : Plusieurs tweets mal prédits détectés !")
 
         return {"message": "Feedback enregistré, merci !"}
@@ -187,4 +872,5 @@ async def test_log():
 # === Exécution locale ===
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run("main:app", host="0.0.0.0", port=port)
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers)
@@ -1,27 +1,363 @@
+import os
+import json
+import asyncio
+import time
+import threading
+import numpy as np
 import pytest
+from types import SimpleNamespace
 from fastapi.testclient import TestClient
-from main import app  # Import du fichier principal
+from azure.storage.blob import BlobServiceClient
+from tensorflow.keras.preprocessing.text import tokenizer_from_json
+import main
+from main import app, MODEL_BLOBS, MODEL_DIR  # Import du fichier principal
 
-client = TestClient(app)
+@pytest.fixture(scope="module")
+def client():
+    # Le contexte déclenche le lifespan (chargement des modèles, micro-batching)
+    with TestClient(app) as test_client:
+        yield test_client
 
 # === TESTS PREDICTION ===
-def test_predict_positive():
+def test_predict_positive(client):
     response = client.post("/predict", json={"text": "This is a great day!"})
     assert response.status_code == 200
     assert response.json() == {"prediction": "positive"}
 
-def test_predict_negative():
+def test_predict_negative(client):
     response = client.post("/predict", json={"text": "This is a terrible day!"})
     assert response.status_code == 200
     assert response.json() == {"prediction": "negative"}
 
-def test_predict_empty():
+def test_predict_cached_normalized(client):
+    first = client.post("/predict", json={"text": "What a lovely cached morning!"})
+    hits = main.cache_stats["hits"]
+    misses = main.cache_stats["misses"]
+
+    second = client.post("/predict", json={"text": "  WHAT A LOVELY CACHED MORNING!  "})
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert main.cache_stats["hits"] == hits + 1
+    assert main.cache_stats["misses"] == misses
+
+def test_predict_cache_keeps_tokenized_whitespace(client):
+    # "\r" fait partie du token pour Keras : les deux textes ne partagent pas d'entrée de cache
+    client.post("/predict", json={"text": "Cached carriage return love"})
+    misses = main.cache_stats["misses"]
+
+    response = client.post("/predict", json={"text": "Cached carriage return love\r"})
+    assert response.status_code == 200
+    assert main.cache_stats["misses"] == misses + 1
+    assert "cached carriage return love\r" in main.prediction_cache
+
+def test_predict_empty(client):
     response = client.post("/predict", json={"text": ""})
     assert response.status_code == 400
     assert response.json()["detail"] == "Le texte d'entrée est vide"
 
+# === TESTS TELECHARGEMENT DES MODELES ===
+class FakeDownloader:
+    def __init__(self, data, fail):
+        self.data = data
+        self.fail = fail
+
+    def readinto(self, f):
+        f.write(self.data[:2])
+        if self.fail:
+            raise IOError("connexion interrompue")
+        f.write(self.data[2:])
+
+class FakeBlobClient:
+    def __init__(self, data=b"model-v2", etag='"0x2"', unreachable=False, fail_download=False):
+        self.data = data
+        self.etag = etag
+        self.unreachable = unreachable
+        self.fail_download = fail_download
+        self.downloads = 0
+        self.probe_options = None
+
+    def get_blob_properties(self, **kwargs):
+        self.probe_options = kwargs
+        if self.unreachable:
+            raise ConnectionError("Azure injoignable")
+        return SimpleNamespace(size=len(self.data), etag=self.etag)
+
+    def download_blob(self, **kwargs):
+        self.downloads += 1
+        return FakeDownloader(self.data, self.fail_download)
+
+@pytest.fixture
+def fake_blob(monkeypatch, tmp_path):
+    def install(**kwargs):
+        blob_client = FakeBlobClient(**kwargs)
+        monkeypatch.setattr(main, "MODEL_DIR", str(tmp_path))
+        monkeypatch.setattr(main, "blob_service_client", SimpleNamespace(get_blob_client=lambda container, name: blob_client))
+        return blob_client
+    return install
+
+def _write_local(tmp_path, data, etag=None):
+    (tmp_path / "model.keras").write_bytes(data)
+    if etag is not None:
+        (tmp_path / "model.keras.etag").write_text(etag, encoding="utf-8")
+
+def test_download_skipped_when_up_to_date(fake_blob, tmp_path):
+    blob_client = fake_blob()
+    _write_local(tmp_path, b"model-v2", '"0x2"')
+
+    assert main.download_model_from_azure("model.keras") == str(tmp_path / "model.keras")
+    assert blob_client.downloads == 0
+
+def test_download_on_size_mismatch(fake_blob, tmp_path):
+    blob_client = fake_blob()
+    _write_local(tmp_path, b"partial", '"0x2"')
+
+    main.download_model_from_azure("model.keras")
+    assert blob_client.downloads == 1
+    assert (tmp_path / "model.keras").read_bytes() == b"model-v2"
+
+def test_download_when_etag_file_missing(fake_blob, tmp_path):
+    blob_client = fake_blob()
+    _write_local(tmp_path, b"model-v1")
+
+    main.download_model_from_azure("model.keras")
+    assert blob_client.downloads == 1
+    assert (tmp_path / "model.keras.etag").read_text(encoding="utf-8") == '"0x2"'
+
+def test_local_copy_used_when_azure_unreachable(fake_blob, tmp_path):
+    blob_client = fake_blob(unreachable=True)
+    _write_local(tmp_path, b"model-v1")
+
+    assert main.download_model_from_azure("model.keras") == str(tmp_path / "model.keras")
+    assert blob_client.downloads == 0
+    assert (tmp_path / "model.keras").read_bytes() == b"model-v1"
+    assert blob_client.probe_options["retry_total"] == 0
+
+def test_unreachable_azure_fallback_skips_retry_backoff(monkeypatch, tmp_path):
+    # Vrai client, port fermé : avec la politique par défaut, ~1 min de backoff avant l'échec
+    unreachable_client = BlobServiceClient(account_url="http://127.0.0.1:1/devstoreaccount1")
+    monkeypatch.setattr(main, "MODEL_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "blob_service_client", unreachable_client)
+    _write_local(tmp_path, b"model-v1", '"0x1"')
+
+    start = time.monotonic()
+    assert main.download_model_from_azure("model.keras") == str(tmp_path / "model.keras")
+    assert time.monotonic() - start < 5
+
+def test_failed_download_leaves_no_temporary_file(fake_blob, tmp_path):
+    fake_blob(fail_download=True)
+    _write_local(tmp_path, b"model-v1", '"0x1"')
+
+    assert main.download_model_from_azure("model.keras") is None
+    assert not list(tmp_path.glob("*.tmp"))
+    # L'ancienne copie n'est pas écrasée par le téléchargement partiel
+    assert (tmp_path / "model.keras").read_bytes() == b"model-v1"
+
+# === TESTS MICRO-BATCHING ===
+def test_batcher_stop_releases_pending_requests():
+    release = threading.Event()
+
+    def slow_infer(batch):
+        release.wait(5)
+        return np.full((len(batch), 1), 0.9)
+
+    async def scenario():
+        batcher = main.PredictionBatcher(slow_infer, max_batch=2, timeout=10)
+        await batcher.start()
+
+        # Batch complet envoyé au pool de threads, bloqué dans slow_infer
+        first = asyncio.create_task(batcher.predict([1]))
+        second = asyncio.create_task(batcher.predict([2]))
+        await asyncio.sleep(0.05)
+
+        # Requête en cours de collecte (le batch suivant attend un second élément)
+        collecting = asyncio.create_task(batcher.predict([3]))
+        await asyncio.sleep(0.05)
+
+        stopping = asyncio.create_task(batcher.stop())
+        await asyncio.sleep(0.05)
+        release.set()
+        await asyncio.wait_for(stopping, timeout=5)
+
+        assert await first == pytest.approx(0.9)
+        assert await second == pytest.approx(0.9)
+        with pytest.raises(RuntimeError):
+            await collecting
+
+    asyncio.run(scenario())
+
+def test_batcher_batches_grow_while_inference_is_busy():
+    sizes = []
+
+    def slow_infer(batch):
+        sizes.append(len(batch))
+        threading.Event().wait(0.02)
+        return np.full((len(batch), 1), 0.9)
+
+    async def scenario():
+        batcher = main.PredictionBatcher(slow_infer, max_batch=64, timeout=0.005, concurrency=1)
+        await batcher.start()
+
+        # Une requête par ms, bien plus que ce qu'un batch de 5 ms toutes les 20 ms peut absorber
+        requests = []
+        for i in range(200):
+            requests.append(asyncio.create_task(batcher.predict([i + 1])))
+            await asyncio.sleep(0.001)
+
+        results = await asyncio.wait_for(asyncio.gather(*requests), timeout=10)
+        await batcher.stop()
+        assert results == [pytest.approx(0.9)] * 200
+
+    asyncio.run(scenario())
+    # Sans contre-pression, les batches resteraient à ~5 éléments (un par ms pendant le timeout)
+    assert sum(sizes) == 200
+    assert max(sizes) > 10
+
+# === TESTS TOKENISATION ===
+ENCODE_SAMPLES = [
+    "This is a great day!",
+    "I can't believe it... #fail @someone http://t.co/xyz",
+    "   Multiple   spaces\tand\nnewlines   ",
+    "unknownwordzzz " * 60,
+    "Café crème à l'hôtel, très sympa",
+    "😍😍 love it 🔥!! so good👍",
+    "STRASSE straße İstanbul ISTANBUL",
+    "carriage\rreturn and\x0cform feed",
+    "no\u00a0break space",
+]
+
+def _load_keras_tokenizer():
+    with open(os.path.join(MODEL_DIR, MODEL_BLOBS["tokenizer_fasttext"]), "r", encoding="utf-8") as f:
+        return tokenizer_from_json(json.load(f))
+
+@pytest.mark.parametrize("text", ENCODE_SAMPLES)
+def test_encode_matches_keras_tokenizer(client, text):
+    expected = _load_keras_tokenizer().texts_to_sequences([text])[0][:50]
+    assert client.app.state.encode(text) == expected
+
+@pytest.mark.parametrize("text", ENCODE_SAMPLES)
+def test_encode_regex_fallback_matches_keras_tokenizer(client, text):
+    keras_tokenizer = _load_keras_tokenizer()
+    # Un filtre non ASCII fait passer l'encodeur par le découpage en expression régulière
+    keras_tokenizer.filters += "é€"
+    vocab = main.TokenizerVocab(
+        keras_tokenizer.word_index,
+        num_words=keras_tokenizer.num_words,
+        oov_token=keras_tokenizer.oov_token,
+        filters=keras_tokenizer.filters,
+        lower=keras_tokenizer.lower,
+        split=keras_tokenizer.split
+    )
+
+    expected = keras_tokenizer.texts_to_sequences([text])[0][:50]
+    assert main.build_encoder(vocab)(text) == expected
+
+# === TESTS MOTEUR D'INFERENCE ===
+SENTENCES = [
+    "This is a great day!",
+    "This is a terrible day!",
+    "I love this movie, it made me so happy",
+    "Worst customer service ever, never again",
+    "Just landed in Paris, can't wait to see everyone",
+    "My phone broke again and I lost all my photos",
+    "not bad at all",
+]
+
+@pytest.mark.parametrize("count", [1, 5, 70])
+def test_tflite_int8_matches_keras_model(client, count):
+    state = client.app.state
+    if main._is_stale(main.TFLITE_MODEL_PATH, os.path.join(MODEL_DIR, MODEL_BLOBS["fasttext"])):
+        vocab_size = state.tokenizer.num_words or len(state.tokenizer.word_index) + 1
+        main.convert_to_tflite(state.model, main.TFLITE_MODEL_PATH, vocab_size)
+    runner = main.TFLiteRunner(main.TFLITE_MODEL_PATH, 1, [1, 8, main.MAX_BATCH])
+
+    # Plusieurs tailles : bucket exact, padding dans un bucket, découpage au-delà de MAX_BATCH
+    batch = np.zeros((count, 50), dtype=np.int32)
+    for row, text in zip(batch, (SENTENCES * count)[:count]):
+        ids = state.encode(text)
+        row[:len(ids)] = ids
+
+    expected = state.model(batch, training=False).numpy()[:, 0]
+    scores = runner(batch)[:, 0]
+    assert scores.shape == expected.shape
+    assert np.abs(scores - expected).max() < 0.05
+    assert ((scores > 0.5) == (expected > 0.5)).all()
+
+@pytest.mark.parametrize("count", [1, 5, 20])
+def test_tf_graph_pads_to_fixed_batch_sizes(client, count):
+    state = client.app.state
+    infer = main._build_tf_infer(state.model, [1, 8])
+
+    batch = np.zeros((count, 50), dtype=np.int32)
+    for row, text in zip(batch, (SENTENCES * count)[:count]):
+        ids = state.encode(text)
+        row[:len(ids)] = ids
+
+    expected = state.model(batch, training=False).numpy()
+    np.testing.assert_allclose(infer(batch), expected, atol=1e-5)
+
+def test_onnx_runner_casts_input_and_runs_batch(tmp_path):
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    from onnx import TensorProto, helper
+
+    # Modèle minimal : maximum de chaque séquence, entrée int64 comme un export tf2onnx
+    graph = helper.make_graph(
+        [
+            helper.make_node("Cast", ["input"], ["as_float"], to=TensorProto.FLOAT),
+            helper.make_node("ReduceMax", ["as_float"], ["output"], axes=[1], keepdims=1),
+        ],
+        "max_model",
+        [helper.make_tensor_value_info("input", TensorProto.INT64, [None, 50])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [None, 1])],
+    )
+    model_path = str(tmp_path / "model.onnx")
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)]), model_path)
+
+    runner = main.ONNXRunner(model_path, 1)
+    batch = np.zeros((3, 50), dtype=np.int32)
+    batch[:, 0] = [1, 7, 42]
+
+    assert runner.input_dtype == np.int64
+    np.testing.assert_array_equal(runner(batch), [[1.0], [7.0], [42.0]])
+
+# === TESTS RACCOURCI LEXICAL ===
+LEXICON = main.Lexicon(frozenset({10, 11}), frozenset({20, 21}), max_tokens=3)
+
+@pytest.mark.parametrize("ids, expected", [
+    ([10, 11, 10], "positive"),
+    ([20], "negative"),
+    ([10, 20], None),           # polarités mélangées
+    ([10, 11, 10, 11], None),   # plus long que max_tokens
+    ([10, 1], None),            # token hors vocabulaire (oov)
+    ([], None),
+])
+def test_lexicon_lookup(ids, expected):
+    assert LEXICON.lookup(ids) == expected
+
+def _stub_tokenizer():
+    return main.TokenizerVocab({"<oov>": 1, "love": 2, "hate": 3, "table": 4}, oov_token="<oov>")
+
+def _stub_infer(invert_combinations):
+    """Token 2 très positif, token 3 très négatif, le reste neutre."""
+    def infer(batch):
+        first = batch[:, 0]
+        scores = np.where(first == 2, 0.999, np.where(first == 3, 0.001, 0.5))
+        if invert_combinations:
+            # Les combinaisons de plusieurs tokens contredisent le lexique
+            scores = np.where((batch != 0).sum(axis=1) > 1, 1 - scores, scores)
+        return scores[:, None]
+    return infer
+
+def test_build_lexicon_selects_strong_tokens():
+    lexicon = main.build_lexicon(_stub_infer(invert_combinations=False), _stub_tokenizer())
+    assert lexicon.strong_pos == frozenset({2})
+    assert lexicon.strong_neg == frozenset({3})
+
+def test_build_lexicon_disabled_on_low_agreement():
+    assert main.build_lexicon(_stub_infer(invert_combinations=True), _stub_tokenizer()) is None
+
 # === TESTS FEEDBACK ===
-def test_feedback_valid_positive():
+def test_feedback_valid_positive(client):
     response = client.post("/feedback", json={
         "text": "This is a great day!",
         "prediction": "positive",
@@ -30,7 +366,7 @@ def test_feedback_valid_positive():
     assert response.status_code == 200
     assert response.json() == {"message": "Feedback enregistré, merci !"}
 
-def test_feedback_invalid_prediction():
+def test_feedback_invalid_prediction(client):
     response = client.post("/feedback", json={
         "text": "Some text",
         "prediction": "neutral",  # Erreur, "neutral" n'est pas une valeur acceptée
@@ -39,7 +375,7 @@ def test_feedback_invalid_prediction():
     assert response.status_code == 400
     assert "Prédiction invalide" in response.json()["detail"]
 
-def test_feedback_misclassified():
+def test_feedback_misclassified(client):
     response = client.post("/feedback", json={
         "text": "This is a terrible day!",
         "prediction": "positive",  # Faux